@@ -0,0 +1,262 @@
+/*
+ * Author: Mateusz Janda <mateusz janda at gmail com>
+ * Site: github.com/MateuszJanda/mtpc
+ * Ad maiorem Dei gloriam
+ *
+ * Optional compiled kernels for mtpc hot loops. Every function accepts
+ * bytes-like objects (buffer protocol) and releases the GIL while scanning
+ * data. Pure Python implementations in mtpc.py are the reference - results
+ * must be identical.
+ *
+ * Build: python3 setup.py build_ext --inplace
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <string.h>
+
+#define BYTE_VALUES 256
+#define MASK_SIZE (BYTE_VALUES / 8)
+#define HIGH_BIT_MASK 0x80
+
+static PyObject *
+count_xors_in_pair(PyObject *self, PyObject *args)
+{
+    Py_buffer enc1, enc2;
+    Py_ssize_t counts[BYTE_VALUES] = {0};
+    unsigned char order[BYTE_VALUES];
+    Py_ssize_t order_len = 0;
+    PyObject *result;
+
+    if (!PyArg_ParseTuple(args, "y*y*", &enc1, &enc2))
+        return NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+    const unsigned char *c1 = enc1.buf;
+    const unsigned char *c2 = enc2.buf;
+    Py_ssize_t len = enc1.len < enc2.len ? enc1.len : enc2.len;
+    for (Py_ssize_t i = 0; i < len; i++) {
+        unsigned char xor_result = c1[i] ^ c2[i];
+        /* xor-ing same characters give as 0, and we can't determine what this character are */
+        if (xor_result == 0)
+            continue;
+        if (counts[xor_result]++ == 0)
+            order[order_len++] = xor_result;
+    }
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&enc1);
+    PyBuffer_Release(&enc2);
+
+    /* Keep first occurrence order, so Counter insertion order match pure Python version */
+    result = PyList_New(order_len);
+    if (result == NULL)
+        return NULL;
+    for (Py_ssize_t i = 0; i < order_len; i++) {
+        PyObject *item = Py_BuildValue("(in)", order[i], counts[order[i]]);
+        if (item == NULL) {
+            Py_DECREF(result);
+            return NULL;
+        }
+        PyList_SET_ITEM(result, i, item);
+    }
+
+    return result;
+}
+
+static PyObject *
+or_key_masks(PyObject *self, PyObject *args)
+{
+    Py_buffer enc1, enc2, match_masks, matched, out;
+    Py_buffer skip = {NULL};
+    int unmatched = -1;
+
+    if (!PyArg_ParseTuple(args, "y*y*y*y*w*|y*", &enc1, &enc2, &match_masks, &matched, &out, &skip))
+        return NULL;
+
+    Py_ssize_t len = enc1.len < enc2.len ? enc1.len : enc2.len;
+    if (match_masks.len < BYTE_VALUES * MASK_SIZE || matched.len < BYTE_VALUES || out.len < len * MASK_SIZE) {
+        PyBuffer_Release(&enc1);
+        PyBuffer_Release(&enc2);
+        PyBuffer_Release(&match_masks);
+        PyBuffer_Release(&matched);
+        PyBuffer_Release(&out);
+        if (skip.buf != NULL)
+            PyBuffer_Release(&skip);
+        PyErr_SetString(PyExc_ValueError, "match_masks, matched or out buffer too small");
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    const unsigned char *c1 = enc1.buf;
+    const unsigned char *c2 = enc2.buf;
+    const unsigned char *masks = match_masks.buf;
+    const unsigned char *has_match = matched.buf;
+    const unsigned char *skip_pos = skip.buf;
+    unsigned char *keys = out.buf;
+    for (Py_ssize_t i = 0; i < len; i++) {
+        unsigned char xor_result = c1[i] ^ c2[i];
+        if (xor_result == 0 || (skip_pos != NULL && i < skip.len && skip_pos[i]))
+            continue;
+        /* Matcher failed for this value - report it, so caller can raise the same error */
+        if (!has_match[xor_result]) {
+            unmatched = xor_result;
+            break;
+        }
+
+        const unsigned char *msg_bytes = masks + xor_result * MASK_SIZE;
+        unsigned char *key_bytes = keys + i * MASK_SIZE;
+        for (int m = 0; m < BYTE_VALUES; m++) {
+            if (!(msg_bytes[m >> 3] & (1 << (m & 7))))
+                continue;
+            unsigned char k1 = c1[i] ^ m;
+            unsigned char k2 = c2[i] ^ m;
+            key_bytes[k1 >> 3] |= 1 << (k1 & 7);
+            key_bytes[k2 >> 3] |= 1 << (k2 & 7);
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&enc1);
+    PyBuffer_Release(&enc2);
+    PyBuffer_Release(&match_masks);
+    PyBuffer_Release(&matched);
+    PyBuffer_Release(&out);
+    if (skip.buf != NULL)
+        PyBuffer_Release(&skip);
+    return PyLong_FromLong(unmatched);
+}
+
+static PyObject *
+test_column(PyObject *self, PyObject *args)
+{
+    Py_buffer column, allowed;
+    int key;
+    int result = 1;
+
+    if (!PyArg_ParseTuple(args, "y*iy*", &column, &key, &allowed))
+        return NULL;
+
+    if (allowed.len < BYTE_VALUES) {
+        PyBuffer_Release(&column);
+        PyBuffer_Release(&allowed);
+        PyErr_SetString(PyExc_ValueError, "allowed table must have 256 entries");
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    const unsigned char *c = column.buf;
+    const unsigned char *table = allowed.buf;
+    for (Py_ssize_t i = 0; i < column.len; i++) {
+        if (!table[(c[i] ^ key) & 0xff]) {
+            result = 0;
+            break;
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&column);
+    PyBuffer_Release(&allowed);
+    return PyBool_FromLong(result);
+}
+
+static PyObject *
+most_common_byte(PyObject *self, PyObject *args)
+{
+    Py_buffer column;
+    Py_ssize_t counts[BYTE_VALUES] = {0};
+    Py_ssize_t best = 0;
+    int result = -1;
+
+    if (!PyArg_ParseTuple(args, "y*", &column))
+        return NULL;
+
+    if (column.len == 0) {
+        PyBuffer_Release(&column);
+        PyErr_SetString(PyExc_ValueError, "empty column");
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    const unsigned char *c = column.buf;
+    for (Py_ssize_t i = 0; i < column.len; i++)
+        counts[c[i]]++;
+    for (int b = 0; b < BYTE_VALUES; b++)
+        if (counts[b] > best)
+            best = counts[b];
+    /* Ties are resolved like Counter.most_common(1) - first seen byte wins */
+    for (Py_ssize_t i = 0; i < column.len; i++) {
+        if (counts[c[i]] == best) {
+            result = c[i];
+            break;
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&column);
+    return PyLong_FromLong(result);
+}
+
+static PyObject *
+high_bits_match(PyObject *self, PyObject *args)
+{
+    Py_buffer enc_msg;
+    Py_ssize_t key_length;
+    int result = 1;
+
+    if (!PyArg_ParseTuple(args, "y*n", &enc_msg, &key_length))
+        return NULL;
+
+    /* Same as pure Python version: key_length <= 0 checks no position (match),
+     * and key_length longer than message leaves empty positions (IndexError) */
+    if (key_length > enc_msg.len) {
+        PyBuffer_Release(&enc_msg);
+        PyErr_SetString(PyExc_IndexError, "key length out of message range");
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    const unsigned char *c = enc_msg.buf;
+    for (Py_ssize_t ix = 0; ix < key_length && result; ix++) {
+        unsigned char searched_bit = c[ix] & HIGH_BIT_MASK;
+        for (Py_ssize_t i = ix; i < enc_msg.len; i += key_length) {
+            if ((c[i] & HIGH_BIT_MASK) != searched_bit) {
+                result = 0;
+                break;
+            }
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&enc_msg);
+    return PyBool_FromLong(result);
+}
+
+static PyMethodDef accel_methods[] = {
+    {"count_xors_in_pair", count_xors_in_pair, METH_VARARGS,
+     "count_xors_in_pair(enc1, enc2) -> [(xor, count), ...] in first occurrence order"},
+    {"or_key_masks", or_key_masks, METH_VARARGS,
+     "or_key_masks(enc1, enc2, match_masks, matched, out[, skip]) - OR key byte masks of pair into out, "
+     "positions with non-zero skip are ignored. Return -1 or first xor value without match"},
+    {"test_column", test_column, METH_VARARGS,
+     "test_column(column, key, allowed) -> True if every column byte ^ key is allowed"},
+    {"most_common_byte", most_common_byte, METH_VARARGS,
+     "most_common_byte(column) -> most common byte (first seen wins ties)"},
+    {"high_bits_match", high_bits_match, METH_VARARGS,
+     "high_bits_match(enc_msg, key_length) -> True if each key position keeps same high bit"},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef accel_module = {
+    PyModuleDef_HEAD_INIT,
+    "_mtpc_accel",
+    "Optional compiled kernels for mtpc (GIL released while scanning data).",
+    -1,
+    accel_methods
+};
+
+PyMODINIT_FUNC
+PyInit__mtpc_accel(void)
+{
+    return PyModule_Create(&accel_module);
+}
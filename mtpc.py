@@ -23,9 +23,17 @@ https://en.wiktionary.org/wiki/Wiktionary:Frequency_lists
 import itertools
 from collections import Counter
 from collections import namedtuple
+import heapq
 import operator
 import string
 
+try:
+    # Optional compiled kernels (python3 setup.py build_ext --inplace). Pure
+    # Python code below is the reference implementation.
+    import _mtpc_accel as _accel
+except ImportError:
+    _accel = None
+
 
 # http://www.data-compression.com/english.html
 ENGLISH_LETTERS = {
@@ -58,6 +66,13 @@ ENGLISH_LETTERS = {
     ' ': 0.1918182,
 }
 
+# Bytes sets are stored as 256-bit masks (bit k set when byte k is in set)
+MASK_SIZE = 256 // 8
+
+# Characters printed by ResultView, other are replaced by '_'
+PRINTABLE_CHARS = string.digits + string.ascii_letters + string.punctuation + ' '
+_PRINTABLE_TABLE = bytes([b if chr(b) in PRINTABLE_CHARS else ord('_') for b in range(256)])
+
 
 class LettersDistributor:
     """ Calculate occurrence frequencies for each pairs of letters (e.g. 'a' ^ 'b') """
@@ -96,55 +111,87 @@ class Cracker:
         self._analyzer = EncDataAnalyzer()
         self._char_base = char_base
         self._msg_bytes_matcher = msg_bytes_matcher
+        # Cache of message bytes masks per xor-ed value, filled by _match_mask()
+        self._match_masks = {}
+        # Known key bytes (position -> key byte), set by run()
+        self._fixed_key = {}
 
-    def run(self, enc_msgs):
+    def run(self, enc_msgs, fixed_key=None):
+        """
+        :param enc_msgs: list of encoded messages. Each character should be presented as int
+        :param fixed_key: already known key bytes (position -> key byte), see seed_key(). Those
+            positions are not analyzed
+        """
+        self._fixed_key = fixed_key if fixed_key else {}
         enc_data = self._analyzer.count(enc_msgs)
         self._msg_bytes_matcher.set_xors_freqs(enc_data.xors_freqs)
-        keys = self._get_key_bytes(enc_data.enc_msgs)
-        keys = self._filter_keys(enc_data, keys)
+        if _accel:
+            keys = self._get_key_bytes_accel(enc_data)
+            keys = self._set_fixed_key_bytes(keys)
+            keys = self._filter_keys_accel(enc_data, keys)
+        else:
+            keys = self._get_key_bytes(enc_data.enc_msgs)
+            keys = self._set_fixed_key_bytes(keys)
+            keys = self._filter_keys(enc_data, keys)
         return keys
 
     def _get_key_bytes(self, enc_msgs):
-        key_combinations = []
+        """ Key bytes candidates per position, as 256-bit masks (bit k set when k is candidate).
+        Prediction for each pair is merged immediately, so only one mask per position is kept. """
+        self._match_masks = {}
+        possible_keys = []
         for pos, enc1 in enumerate(enc_msgs):
             for enc2 in enc_msgs[pos + 1:]:
-                key_combinations.append(self._predict_key_for_two_enc_msgs(enc1, enc2))
+                self._merge_key_bytes_per_pos(possible_keys, self._predict_key_for_two_enc_msgs(enc1, enc2))
 
-        keys = self._merge_key_bytes_per_pos(key_combinations)
-        return keys
+        return possible_keys
 
     def _predict_key_for_two_enc_msgs(self, enc1, enc2):
         keys = []
-        for c1, c2 in zip(enc1, enc2):
+        for pos, (c1, c2) in enumerate(zip(enc1, enc2)):
             xor_result = c1 ^ c2
-            if xor_result == 0:
-                keys.append(set())
+            if xor_result == 0 or pos in self._fixed_key:
+                keys.append(0)
             else:
-                msg_bytes = self._msg_bytes_matcher.match(xor_result)
+                msg_bytes = self._match_mask(xor_result)
                 keys.append(self._match_key_bytes_by_msg_bytes(c1, c2, msg_bytes))
 
         return keys
 
+    def _match_mask(self, xor_result):
+        """ Message bytes matching xor-ed value, as 256-bit mask (cached per run) """
+        if xor_result not in self._match_masks:
+            self._match_masks[xor_result] = bytes_to_mask(self._msg_bytes_matcher.match(xor_result))
+        return self._match_masks[xor_result]
+
     def _match_key_bytes_by_msg_bytes(self, c1, c2, msg_bytes):
-        key_bytes = [c1 ^ m for m in msg_bytes]
-        key_bytes += [c2 ^ m for m in msg_bytes]
-        return set(key_bytes)
+        """ Key bytes (k = c ^ m) for each message byte m in msg_bytes mask, as 256-bit mask """
+        return xor_mask(msg_bytes, c1) | xor_mask(msg_bytes, c2)
 
-    def _merge_key_bytes_per_pos(self, key_combinations):
-        possible_keys = []
-        for comb in key_combinations:
-            for pos, keys in enumerate(comb):
-                if pos >= len(possible_keys):
-                    possible_keys.append(set())
-                possible_keys[pos].update(keys)
+    def _merge_key_bytes_per_pos(self, possible_keys, keys):
+        for pos, key_bytes in enumerate(keys):
+            if pos >= len(possible_keys):
+                possible_keys.append(0)
+            possible_keys[pos] |= key_bytes
 
-        return possible_keys
+    def _set_fixed_key_bytes(self, keys_per_pos):
+        """ Replace candidates on known positions by known key byte """
+        for pos, key in sorted(self._fixed_key.items()):
+            while pos >= len(keys_per_pos):
+                keys_per_pos.append(0)
+            keys_per_pos[pos] = 1 << key
+
+        return keys_per_pos
 
     def _filter_keys(self, enc_data, keys_per_pos):
         possible_keys = []
         for pos, keys in enumerate(keys_per_pos):
+            if pos in self._fixed_key:
+                possible_keys.append([self._fixed_key[pos]])
+                continue
+
             possible_keys.append([])
-            for k in keys:
+            for k in mask_to_bytes(keys):
                 if self._test_column(pos, k, enc_data.enc_msgs):
                     possible_keys[-1].append(k)
 
@@ -163,6 +210,59 @@ class Cracker:
 
         return True
 
+    def _get_key_bytes_accel(self, enc_data):
+        """ Same as _get_key_bytes(), but masks are collected by compiled kernel
+        in 32-byte blocks (one per position). """
+        # Matcher may fail (KeyError) for some xor-ed values. Kernel reports them only
+        # when found on analyzed position, then error is raised like in _match_mask()
+        match_masks = bytearray(256 * MASK_SIZE)
+        matched = bytearray(256)
+        for xor_result in enc_data.xors_counts:
+            try:
+                mask = bytes_to_mask(self._msg_bytes_matcher.match(xor_result))
+            except KeyError:
+                continue
+            match_masks[xor_result * MASK_SIZE:(xor_result + 1) * MASK_SIZE] = mask.to_bytes(MASK_SIZE, 'little')
+            matched[xor_result] = 1
+
+        enc_bufs = [bytes(e) for e in enc_data.enc_msgs]
+        skip = bytearray(max([len(e) for e in enc_bufs], default=0))
+        for pos in self._fixed_key:
+            if 0 <= pos < len(skip):
+                skip[pos] = 1
+
+        keys_len = 0
+        key_masks = bytearray()
+        for pos, enc1 in enumerate(enc_bufs):
+            for enc2 in enc_bufs[pos + 1:]:
+                pair_len = min(len(enc1), len(enc2))
+                if pair_len > keys_len:
+                    key_masks.extend(bytes((pair_len - keys_len) * MASK_SIZE))
+                    keys_len = pair_len
+                unmatched = _accel.or_key_masks(enc1, enc2, match_masks, matched, key_masks, skip)
+                if unmatched >= 0:
+                    self._msg_bytes_matcher.match(unmatched)
+
+        return [int.from_bytes(key_masks[pos * MASK_SIZE:(pos + 1) * MASK_SIZE], 'little')
+                for pos in range(keys_len)]
+
+    def _filter_keys_accel(self, enc_data, keys_per_pos):
+        """ Same as _filter_keys(), but columns are tested by compiled kernel. """
+        allowed = bytes([chr(b) in self._char_base for b in range(256)])
+        columns = get_columns(enc_data.enc_msgs, len(keys_per_pos))
+
+        possible_keys = []
+        for pos, keys in enumerate(keys_per_pos):
+            if pos in self._fixed_key:
+                possible_keys.append([self._fixed_key[pos]])
+                continue
+
+            possible_keys.append([k for k in mask_to_bytes(keys) if _accel.test_column(columns[pos], k, allowed)])
+            if not possible_keys[-1]:
+                possible_keys[-1] = [None]
+
+        return possible_keys
+
 
 EncData = namedtuple('EncData', ['enc_msgs', 'xors_counts', 'xors_freqs'])
 
@@ -183,6 +283,9 @@ class EncDataAnalyzer:
 
     def _count_xors(self, enc_msgs):
         xors_counts = Counter()
+        if _accel:
+            enc_msgs = [bytes(e) for e in enc_msgs]
+
         for num, enc1 in enumerate(enc_msgs):
             for enc2 in enc_msgs[num+1:]:
                 self._count_xors_in_pair(xors_counts, enc1, enc2)
@@ -190,6 +293,11 @@ class EncDataAnalyzer:
         return xors_counts
 
     def _count_xors_in_pair(self, xors_counts, enc1, enc2):
+        if _accel:
+            for xor_result, count in _accel.count_xors_in_pair(enc1, enc2):
+                xors_counts[xor_result] += count
+            return
+
         for c1, c2 in zip(enc1, enc2):
             xor_result = c1 ^ c2
             # xor-ing same characters give as 0, and we can't determine what this character are
@@ -281,18 +389,97 @@ class FreqOrderMatcher:
 
 
 class ResultView:
-    def show(self, enc_msgs, keys_candidates, char_base, checks=1):
+    def show(self, enc_msgs, keys_candidates, char_base, checks=1, lang_stats=ENGLISH_LETTERS):
         self._print_num_of_combinations(keys_candidates)
-        for num, key in enumerate(itertools.product(*keys_candidates)):
-            if num >= checks:
-                break
+        for key, score in self.rank(enc_msgs, keys_candidates, char_base, checks, lang_stats):
             self._print_keys_counts(keys_candidates)
             self._print_index(key)
             self._print_secret_msgs(enc_msgs, key)
             self._print_secret_key_str(key, char_base)
             self._print_secret_key_hex(key)
+            self._print_score(score)
             self._print_separator()
 
+    def rank(self, enc_msgs, keys_candidates, char_base, top=1, lang_stats=ENGLISH_LETTERS):
+        """
+        Find best keys. Score is average weight (0-1) of decrypted bytes on known key positions,
+        see _char_weights(). Score is a sum of independent column scores, so keys are generated
+        best-first from column losses (score drop against best candidate in the same column).
+        :return: list of (key, score) tuples, from best to worst
+        """
+        if top < 1 or not all(keys_candidates):
+            return []
+
+        weights = self._char_weights(char_base, lang_stats)
+        columns = get_columns(enc_msgs, len(keys_candidates))
+
+        best_key = []
+        best_total = 0
+        total_len = 0
+        # (position, [(loss, key), ...] sorted by loss) for positions with more than one candidate
+        choices = []
+        for pos, keys in enumerate(keys_candidates):
+            if None in keys:
+                best_key.append(keys[0])
+                continue
+
+            col = columns[pos]
+            col_scores = [(sum(xor_bytes(col, bytes([k]) * len(col)).translate(weights)), k) for k in keys]
+            col_scores.sort(key=operator.itemgetter(0), reverse=True)
+            best_key.append(col_scores[0][1])
+            best_total += col_scores[0][0]
+            total_len += len(col)
+            if len(col_scores) > 1:
+                choices.append((pos, [(col_scores[0][0] - score, k) for score, k in col_scores]))
+
+        # Changing column with smaller loss first, guarantees that "shift" children are not better than parent
+        choices.sort(key=lambda choice: choice[1][1][0])
+        ranked = [(tuple(best_key), 0)]
+        queue = []
+        counter = itertools.count()
+        if choices:
+            heapq.heappush(queue, (choices[0][1][1][0], next(counter), ((0, 1),)))
+
+        # Each combination is a tuple of changes (choice index, candidate index) with unique parent, so is
+        # generated once. Children: next candidate in last changed column, change also next column, or
+        # (for first candidate change) move change to next column.
+        while queue and len(ranked) < top:
+            loss, _, changes = heapq.heappop(queue)
+            key = list(best_key)
+            for c, i in changes:
+                key[choices[c][0]] = choices[c][1][i][1]
+            ranked.append((tuple(key), loss))
+
+            c, i = changes[-1]
+            col_losses = choices[c][1]
+            if i + 1 < len(col_losses):
+                heapq.heappush(queue, (loss - col_losses[i][0] + col_losses[i + 1][0], next(counter),
+                                       changes[:-1] + ((c, i + 1),)))
+            if c + 1 < len(choices):
+                next_loss = choices[c + 1][1][1][0]
+                heapq.heappush(queue, (loss + next_loss, next(counter), changes + ((c + 1, 1),)))
+                if i == 1:
+                    heapq.heappush(queue, (loss - col_losses[1][0] + next_loss, next(counter),
+                                           changes[:-1] + ((c + 1, 1),)))
+
+        return [(key, (best_total - loss) / (255 * total_len) if total_len else 0.0) for key, loss in ranked]
+
+    def _char_weights(self, char_base, lang_stats):
+        """ Translation table: byte -> weight (0-255). Characters from char_base are weighted
+        by letters frequency (at least 1), other characters by 0. """
+        max_freq = max(lang_stats.values())
+        weights = []
+        for b in range(256):
+            ch = chr(b)
+            if ch not in char_base:
+                weights.append(0)
+            elif ch.lower() in lang_stats:
+                weights.append(max(1, round(255 * lang_stats[ch.lower()] / max_freq)))
+            else:
+                weights.append(1)
+
+        return bytes(weights)
+
     def _print_num_of_combinations(self, keys_candidates):
         num_of_combinations = 1
         for keys in keys_candidates:
@@ -305,17 +492,21 @@ class ResultView:
         print('Keys counts: ' + ''.join(['*' if len(keys) >= 10 else str(len(keys)) for keys in keys_candidates]))
 
     def _print_secret_msgs(self, enc_msgs, key):
+        key_bytes = bytes([0 if k is None else k for k in key])
+        unknown_pos = [pos for pos, k in enumerate(key) if k is None]
+        lines = []
         for num, enc_msg in enumerate(enc_msgs):
-            output = ''
-            for c, k in zip(enc_msg, key):
-                if k is not None and chr(c ^ k) in string.digits + string.ascii_letters + string.punctuation + ' ':
-                    output += chr(c ^ k)
-                else:
-                    output += '_'
+            size = min(len(enc_msg), len(key))
+            output = bytearray(xor_bytes(bytes(enc_msg[:size]), key_bytes[:size]).translate(_PRINTABLE_TABLE))
+            for pos in unknown_pos:
+                if pos < size:
+                    output[pos] = ord('_')
             space = '.....'
             if num >= 10:
                 space = '....'
-            print('Plain' + space + str(num) + ': ' + output)
+            lines.append('Plain' + space + str(num) + ': ' + output.decode())
+
+        print('\n'.join(lines))
 
     def _print_index(self, key):
         output = ''
@@ -345,6 +536,9 @@ class ResultView:
 
         print('Key (hex)..: ' + result)
 
+    def _print_score(self, score):
+        print('Score......: ' + '{:.3f}'.format(score))
+
     def _print_separator(self):
         print('End check')
 
@@ -395,6 +589,10 @@ def key_len_hamming_dist(enc_msg, key_len_range):
 
 def key_len_high_bits(enc_msg, key_len_range):
     """ Works only when key contain high bits (key is not build from printable characters) """
+    if _accel:
+        enc_buf = bytes(enc_msg)
+        return [key_length for key_length in key_len_range if _accel.high_bits_match(enc_buf, key_length)]
+
     HIGH_BIT_MASK = 0x80
     result = []
     for key_length in key_len_range:
@@ -429,43 +627,166 @@ def hamming_distance(enc_msg, key_length):
     return bits / key_length
 
 
-def crack_blocks(enc_msgs, method='spaces', lang_stats=ENGLISH_LETTERS, char_base=string.ascii_letters+" '"):
+def crack_blocks(enc_msgs, method='spaces', lang_stats=ENGLISH_LETTERS, char_base=string.ascii_letters+" '",
+                 known_plaintext=None, known_key=None):
     """
     Crack blocks of bytes stream, where key was reused for each block.
     :param enc_msgs: list of encoded messages. Each character should be presented as int
     :param method: cracking method: 'best-freq', 'first-order-freq', 'spaces'
     :param lang_stats: letters frequency distribution of specific language. By default ENGLISH_LETTERS
     :param char_base: characters expected in output message
+    :param known_plaintext: list of (msg_num, offset, text) - text (str or bytes) known at offset in
+        message msg_num
+    :param known_key: known key bytes, as dict position -> key byte
     """
+    fixed_key = seed_key(enc_msgs, known_plaintext, known_key)
+    lang_stats = sharpen_lang_stats(lang_stats, enc_msgs, fixed_key, known_plaintext)
+
     if method == 'best-freq':
         msg_bytes_matcher = FreqMatcher(lang_stats, delta=0.3)
         cracker = Cracker(char_base, msg_bytes_matcher)
-        keys_candidates = cracker.run(enc_msgs)
+        keys_candidates = cracker.run(enc_msgs, fixed_key)
     elif method == 'first-order-freq':
         msg_bytes_matcher = FreqOrderMatcher(lang_stats)
         cracker = Cracker(char_base, msg_bytes_matcher)
-        keys_candidates = cracker.run(enc_msgs)
+        keys_candidates = cracker.run(enc_msgs, fixed_key)
     elif method == 'spaces':
-        keys_candidates = find_key_by_most_common_char(enc_msgs)
+        keys_candidates = find_key_by_most_common_char(enc_msgs, fixed_key=fixed_key)
     else:
         raise Exception
 
     v = ResultView()
-    v.show(enc_msgs, keys_candidates, char_base)
+    v.show(enc_msgs, keys_candidates, char_base, lang_stats=lang_stats)
+
 
+def find_key_by_most_common_char(enc_msgs, most_common_ch=' ', fixed_key=None):
+    """ Find key by most common character (be default space). Known key bytes
+    (fixed_key: position -> key byte) are used as they are. """
+    fixed_key = fixed_key if fixed_key else {}
+    most_common_byte = ord(most_common_ch)
+    if _accel:
+        columns = get_columns(enc_msgs, max([len(e) for e in enc_msgs], default=0))
+        return [[fixed_key[ix]] if ix in fixed_key else [_accel.most_common_byte(col) ^ most_common_byte]
+                for ix, col in enumerate(columns)]
 
-def find_key_by_most_common_char(enc_msgs, most_common_ch=' '):
-    """ Find key by most common character (be default space) """
     counters = []
     for e in enc_msgs:
         for ix in range(len(e)):
             if ix == len(counters):
                 counters.append(Counter())
-            counters[ix][e[ix]] += 1
+            if ix not in fixed_key:
+                counters[ix][e[ix]] += 1
 
-    most_common_byte = ord(most_common_ch)
     keys_candidates = []
     for ix in range(len(counters)):
-        keys_candidates.append([counters[ix].most_common(1)[0][0] ^ most_common_byte])
+        if ix in fixed_key:
+            keys_candidates.append([fixed_key[ix]])
+        else:
+            keys_candidates.append([counters[ix].most_common(1)[0][0] ^ most_common_byte])
 
     return keys_candidates
+
+
+def seed_key(enc_msgs, known_plaintext=None, known_key=None):
+    """
+    Collect known key bytes
+    :param enc_msgs: list of encoded messages. Each character should be presented as int
+    :param known_plaintext: list of (msg_num, offset, text) - text (str or bytes) known at offset in
+        message msg_num
+    :param known_key: known key bytes, as dict position -> key byte
+    :return: dict position -> key byte. Raise exception for messages or positions out of range,
+        values which are not bytes, or conflicting known plaintext
+    """
+    max_len = max([len(e) for e in enc_msgs], default=0)
+    fixed_key = dict(known_key) if known_key else {}
+    for pos, key in fixed_key.items():
+        if not 0 <= pos < max_len:
+            raise Exception('Known key position ' + str(pos) + ' out of messages range')
+        if not 0 <= key < 256:
+            raise Exception('Known key at position ' + str(pos) + ' is not a byte: ' + str(key))
+
+    for msg_num, offset, text in (known_plaintext if known_plaintext else []):
+        if not 0 <= msg_num < len(enc_msgs):
+            raise Exception('Known plaintext message ' + str(msg_num) + ' out of messages range')
+
+        enc_msg = enc_msgs[msg_num]
+        if offset < 0 or offset + len(text) > len(enc_msg):
+            raise Exception('Known plaintext out of message ' + str(msg_num) + ' range')
+
+        for pos, ch in enumerate(text, start=offset):
+            # Text can be str or bytes (iterated as ints)
+            key = enc_msg[pos] ^ (ord(ch) if isinstance(ch, str) else ch)
+            if not 0 <= key < 256:
+                raise Exception('Known plaintext character ' + repr(ch) + ' at position ' + str(pos) +
+                                ' is not a byte')
+            if fixed_key.setdefault(pos, key) != key:
+                raise Exception('Known plaintext conflicts with key at position ' + str(pos))
+
+    return fixed_key
+
+
+def sharpen_lang_stats(lang_stats, enc_msgs, fixed_key, known_plaintext=None, prior_weight=100):
+    """ Blend letters distribution with letters recovered on known key positions. Supplied
+    known_plaintext (e.g. protocol headers) is not counted, only recovered plaintext of other
+    messages. lang_stats is weighted as prior_weight recovered letters. """
+    known_cells = set()
+    for msg_num, offset, text in (known_plaintext if known_plaintext else []):
+        known_cells.update([(msg_num, pos) for pos in range(offset, offset + len(text))])
+
+    counts = Counter()
+    for pos, key in fixed_key.items():
+        for msg_num, e in enumerate(enc_msgs):
+            if pos < len(e) and (msg_num, pos) not in known_cells:
+                ch = chr(e[pos] ^ key).lower()
+                if ch in lang_stats:
+                    counts[ch] += 1
+
+    total = sum(counts.values())
+    if not total:
+        return lang_stats
+
+    lang_total = sum(lang_stats.values())
+    return {ch: (prior_weight * f / lang_total + counts[ch]) / (prior_weight + total)
+            for ch, f in lang_stats.items()}
+
+
+def get_columns(enc_msgs, columns_count):
+    """ Transpose messages into columns (bytes at the same position), skipping too short messages """
+    return [bytes([e[pos] for e in enc_msgs if pos < len(e)]) for pos in range(columns_count)]
+
+
+def bytes_to_mask(byte_values):
+    """ Convert iterable of bytes (ints) to 256-bit mask """
+    mask = 0
+    for b in byte_values:
+        mask |= 1 << b
+    return mask
+
+
+def mask_to_bytes(mask):
+    """ Iterate over bytes (ints) in 256-bit mask, in ascending order """
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+
+def xor_mask(mask, value):
+    """ Mask of {b ^ value for b in mask}. Xor-ing with each bit of value swaps
+    halves of every 2^bit sized block in mask. """
+    for bit in range(8):
+        if not value & (1 << bit):
+            continue
+        shift = 1 << bit
+        low = _XOR_HALF_MASKS[bit]
+        mask = ((mask & low) << shift) | ((mask >> shift) & low)
+    return mask
+
+
+# _XOR_HALF_MASKS[bit] selects lower half of every 2^(bit+1) sized block in 256-bit mask
+_XOR_HALF_MASKS = [sum([1 << b for b in range(256) if not b & (1 << bit)]) for bit in range(8)]
+
+
+def xor_bytes(data, key):
+    """ Xor two equal length bytes objects at once (as big integers) """
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(key, 'big')).to_bytes(len(data), 'big')
@@ -6,6 +6,7 @@ Site: github.com/MateuszJanda/mtpc
 Ad maiorem Dei gloriam
 """
 
+import random
 import unittest
 from unittest import mock
 from unittest.mock import mock_open
@@ -148,6 +149,26 @@ class TestCracker(unittest.TestCase):
                                                 [None],
                                                 [None]])
 
+    def test_crack_whenKeyIsFixed_fixedPositionsAreNotAnalyzed(self):
+        letters_dist = {
+            'a': 0.75,
+            'b': 0.25
+        }
+        char_base = 'ab'
+        matcher = mtpc.FreqMatcher(letters_dist, delta=0.15)
+        c = mtpc.Cracker(char_base, matcher)
+
+        enc_msgs = [
+            encrypt_otp(msg='aaba', key='abaa'),
+            encrypt_otp(msg='baaa', key='abaa')
+        ]
+
+        keys_candidates = c.run(enc_msgs, fixed_key={0: ord('a'), 1: ord('b')})
+        self.assertEqual(keys_candidates, [[ord('a')],
+                                           [ord('b')],
+                                           [ord('a'), ord('b')],
+                                           [None]])
+
 
 class TestCrackStream(unittest.TestCase):
     def test_hammingDistance(self):
@@ -185,6 +206,109 @@ class TestCrackBlock(unittest.TestCase):
                                                 [ord('a') ^ ord('y') ^ ord(' ')],
                                                 [ord('b') ^ ord('z') ^ ord(' ')]])
 
+    def test_findKeyByMostCommonChar_whenKeyIsFixed(self):
+        enc_msgs = [
+            encrypt_otp(msg=' a a', key='vxyz'),
+            encrypt_otp(msg='  ab', key='vxyz'),
+            encrypt_otp(msg='b ab', key='vxyz')
+        ]
+
+        keys_candidates = mtpc.find_key_by_most_common_char(enc_msgs, fixed_key={2: ord('y')})
+        self.assertEqual(keys_candidates, [[ord('v')],
+                                           [ord('x')],
+                                           [ord('y')],
+                                           [ord('b') ^ ord('z') ^ ord(' ')]])
+
+    def test_seedKey(self):
+        enc_msgs = [
+            encrypt_otp(msg='GET /', key='vxyzw'),
+            encrypt_otp(msg='abcd', key='vxyzw')
+        ]
+
+        fixed_key = mtpc.seed_key(enc_msgs, known_plaintext=[(1, 1, 'bc')], known_key={4: ord('w')})
+        self.assertEqual(fixed_key, {1: ord('x'), 2: ord('y'), 4: ord('w')})
+
+    def test_seedKey_whenKnownPlaintextIsBytes(self):
+        enc_msgs = [
+            encrypt_otp(msg='GET /', key='vxyzw'),
+            encrypt_otp(msg='abcd', key='vxyzw')
+        ]
+
+        fixed_key = mtpc.seed_key(enc_msgs, known_plaintext=[(0, 0, b'GET')])
+        self.assertEqual(fixed_key, mtpc.seed_key(enc_msgs, known_plaintext=[(0, 0, 'GET')]))
+        self.assertEqual(fixed_key, {0: ord('v'), 1: ord('x'), 2: ord('y')})
+
+    def test_seedKey_whenKnownPlaintextConflicts_raiseException(self):
+        enc_msgs = [
+            encrypt_otp(msg='GET /', key='vxyzw'),
+            encrypt_otp(msg='abcd', key='vxyzw')
+        ]
+
+        with self.assertRaises(Exception):
+            mtpc.seed_key(enc_msgs, known_plaintext=[(0, 0, 'GET'), (1, 0, 'xyz')])
+
+    def test_seedKey_whenKnownPlaintextMessageIsOutOfRange_raiseException(self):
+        enc_msgs = [encrypt_otp(msg='abcd', key='vxyz')]
+
+        for msg_num in [-1, 1]:
+            with self.assertRaises(Exception):
+                mtpc.seed_key(enc_msgs, known_plaintext=[(msg_num, 0, 'a')])
+
+    def test_seedKey_whenKnownKeyPositionIsNegative_raiseException(self):
+        enc_msgs = [encrypt_otp(msg='abcd', key='vxyz')]
+
+        with self.assertRaises(Exception):
+            mtpc.seed_key(enc_msgs, known_key={-1: 5})
+
+    def test_seedKey_whenKnownKeyPositionIsPastMessages_raiseException(self):
+        enc_msgs = [encrypt_otp(msg='abcd', key='vxyz')]
+
+        with self.assertRaises(Exception):
+            mtpc.seed_key(enc_msgs, known_key={4: 5})
+
+    def test_seedKey_whenKnownKeyIsNotByte_raiseException(self):
+        enc_msgs = [encrypt_otp(msg='abcd', key='vxyz')]
+
+        with self.assertRaises(Exception):
+            mtpc.seed_key(enc_msgs, known_key={0: 300})
+
+    def test_seedKey_whenKnownPlaintextIsNotByte_raiseException(self):
+        enc_msgs = [encrypt_otp(msg='abcd', key='vxyz')]
+
+        with self.assertRaises(Exception):
+            mtpc.seed_key(enc_msgs, known_plaintext=[(0, 1, '\u017c')])
+
+    def test_sharpenLangStats(self):
+        letters_dist = {
+            'a': 0.5,
+            'b': 0.5
+        }
+        enc_msgs = [
+            encrypt_otp(msg='ab', key='vx'),
+            encrypt_otp(msg='Aa', key='vx'),
+            encrypt_otp(msg='a', key='v')
+        ]
+
+        lang_stats = mtpc.sharpen_lang_stats(letters_dist, enc_msgs, {0: ord('v')}, prior_weight=1)
+        self.assertAlmostEqual(lang_stats['a'], (0.5 + 3) / 4)
+        self.assertAlmostEqual(lang_stats['b'], 0.5 / 4)
+
+    def test_sharpenLangStats_whenKnownPlaintextGiven_skipIt(self):
+        letters_dist = {
+            'a': 0.5,
+            'b': 0.5
+        }
+        enc_msgs = [
+            encrypt_otp(msg='aa', key='vx'),
+            encrypt_otp(msg='bb', key='vx')
+        ]
+        known_plaintext = [(0, 0, 'aa')]
+        fixed_key = mtpc.seed_key(enc_msgs, known_plaintext)
+
+        lang_stats = mtpc.sharpen_lang_stats(letters_dist, enc_msgs, fixed_key, known_plaintext, prior_weight=1)
+        self.assertAlmostEqual(lang_stats['a'], 0.5 / 3)
+        self.assertAlmostEqual(lang_stats['b'], (0.5 + 2) / 3)
+
 
 class TestLettersDistributor(unittest.TestCase):
     def test_distribution(self):
@@ -193,6 +317,118 @@ class TestLettersDistributor(unittest.TestCase):
         self.assertAlmostEqual(freq_sum, 1.0)
 
 
+class TestResultView(unittest.TestCase):
+    def test_rank_returnBestKeysFirst(self):
+        letters_dist = {
+            'a': 0.75,
+            'b': 0.25
+        }
+        enc_msgs = [
+            encrypt_otp_int(msg='aa', key=[0x10, 0x20]),
+            encrypt_otp_int(msg='ab', key=[0x10, 0x20])
+        ]
+        keys_candidates = [[0x13, 0x10], [0x20, 0x23], [None]]
+
+        v = mtpc.ResultView()
+        result = v.rank(enc_msgs, keys_candidates, char_base='abc', top=2, lang_stats=letters_dist)
+        self.assertEqual([key for key, _ in result], [(0x10, 0x20, None), (0x10, 0x23, None)])
+        self.assertAlmostEqual(result[0][1], (3 * 255 + 85) / (4 * 255))
+
+    def test_rank_whenSecondBestKeyChangesFirstColumn(self):
+        letters_dist = {
+            'a': 1.0,
+            'b': 0.9,
+            'c': 0.1
+        }
+        enc_msgs = [encrypt_otp_int(msg='a' * 20, key=[0x00] * 20)]
+        # 2^20 combinations. Column 0: 'a' or 'b' (small loss), other columns: 'a' or 'c' (big loss)
+        keys_candidates = [[0x03, 0x00]] + [[0x02, 0x00]] * 19
+
+        v = mtpc.ResultView()
+        result = v.rank(enc_msgs, keys_candidates, char_base='abc', top=2, lang_stats=letters_dist)
+        self.assertEqual([key for key, _ in result], [(0x00,) * 20, (0x03,) + (0x00,) * 19])
+        self.assertAlmostEqual(result[1][1], (19 * 255 + 230) / (20 * 255))
+
+    def test_printSecretMsgs(self):
+        enc_msgs = [
+            encrypt_otp_int(msg='ab\tc', key=[0x10, 0x20, 0x30, 0x40]),
+            encrypt_otp_int(msg='a', key=[0x10])
+        ]
+
+        v = mtpc.ResultView()
+        with mock.patch('builtins.print') as print_mock:
+            v._print_secret_msgs(enc_msgs, (0x10, None, 0x30, 0x40))
+
+        print_mock.assert_called_once_with('Plain.....0: a__c\nPlain.....1: a')
+
+
+class TestKeyMasks(unittest.TestCase):
+    def test_maskToBytes(self):
+        mask = mtpc.bytes_to_mask([0xff, 0x00, 0x61])
+        self.assertEqual(list(mtpc.mask_to_bytes(mask)), [0x00, 0x61, 0xff])
+
+    def test_xorMask(self):
+        byte_values = [0x00, 0x20, 0x61, 0x62, 0xff]
+        mask = mtpc.xor_mask(mtpc.bytes_to_mask(byte_values), 0x41)
+        self.assertEqual(list(mtpc.mask_to_bytes(mask)), sorted([b ^ 0x41 for b in byte_values]))
+
+
+@unittest.skipUnless(mtpc._accel, 'compiled kernels not built (python3 setup.py build_ext --inplace)')
+class TestAccel(unittest.TestCase):
+    """ Differential tests - compiled kernels against pure Python reference on random inputs. """
+    def setUp(self):
+        self._rand = random.Random(0x6d747063)
+
+    def _random_enc_msgs(self, char_base='ab c', max_len=40):
+        key = [self._rand.randrange(256) for _ in range(max_len)]
+        msgs = [''.join(self._rand.choice(char_base) for _ in range(self._rand.randrange(1, max_len)))
+                for _ in range(self._rand.randrange(2, 8))]
+        return [encrypt_otp_int(msg, key) for msg in msgs]
+
+    def _run_pure(self, func, *args, **kwargs):
+        with mock.patch.object(mtpc, '_accel', None):
+            return func(*args, **kwargs)
+
+    def test_countXors(self):
+        for _ in range(50):
+            enc_msgs = self._random_enc_msgs()
+            expected = self._run_pure(mtpc.EncDataAnalyzer().count, enc_msgs)
+            result = mtpc.EncDataAnalyzer().count(enc_msgs)
+            self.assertEqual(list(result.xors_counts.items()), list(expected.xors_counts.items()))
+            self.assertEqual(list(result.xors_freqs.items()), list(expected.xors_freqs.items()))
+
+    def test_crackerRun(self):
+        letters_dist = {'a': 0.5, 'b': 0.2, 'c': 0.1, ' ': 0.2}
+        for _ in range(50):
+            enc_msgs = self._random_enc_msgs()
+            for matcher in [mtpc.FreqMatcher(letters_dist, delta=0.1), mtpc.FreqOrderMatcher(letters_dist)]:
+                c = mtpc.Cracker('ab c', matcher)
+                fixed_key = {pos: self._rand.randrange(256) for pos in self._rand.sample(range(40), 5)}
+                for fk in [None, fixed_key]:
+                    try:
+                        expected = self._run_pure(c.run, enc_msgs, fk)
+                    except KeyError:
+                        self.assertRaises(KeyError, c.run, enc_msgs, fk)
+                        continue
+                    self.assertEqual(c.run(enc_msgs, fk), expected)
+
+    def test_findKeyByMostCommonChar(self):
+        for _ in range(50):
+            enc_msgs = self._random_enc_msgs()
+            fixed_key = {pos: self._rand.randrange(256) for pos in self._rand.sample(range(40), 5)}
+            self.assertEqual(mtpc.find_key_by_most_common_char(enc_msgs, fixed_key=fixed_key),
+                             self._run_pure(mtpc.find_key_by_most_common_char, enc_msgs, fixed_key=fixed_key))
+
+    def test_keyLenHighBits(self):
+        for _ in range(50):
+            key = [self._rand.choice([0x00, 0xff]) for _ in range(self._rand.randrange(1, 6))]
+            msg = ''.join(self._rand.choice('ab c') for _ in range(self._rand.randrange(12, 60)))
+            enc_msg = encrypt_otp_int(msg, key * len(msg))
+            key_len_range = range(-2, 12)
+            self.assertEqual(mtpc.key_len_high_bits(enc_msg, key_len_range),
+                             self._run_pure(mtpc.key_len_high_bits, enc_msg, key_len_range))
+
+
 if __name__ == '__main__':
     """ python -m unittest discover --pattern=mtpc_tests.py """
     unittest.main()
@@ -0,0 +1,21 @@
+#! /usr/bin/env python3
+
+"""
+Author: Mateusz Janda <mateusz janda at gmail com>
+Site: github.com/MateuszJanda/mtpc
+Ad maiorem Dei gloriam
+"""
+
+"""
+Build optional compiled kernels (mtpc.py works without them):
+python3 setup.py build_ext --inplace
+"""
+
+from setuptools import setup, Extension
+
+
+setup(
+    name='mtpc',
+    py_modules=['mtpc'],
+    ext_modules=[Extension('_mtpc_accel', sources=['_mtpc_accel.c'])],
+)